@@ -1,19 +1,49 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g, has_request_context
 from flask_cors import CORS
 import os, logging, re, random
 from datetime import datetime, timedelta, date, time
 from dateparser.search import search_dates
-from supabase import create_client
+from supabase import create_client, ClientOptions
 from groq import Groq
 from dateutil import tz
+from resiliencia import CircuitBreaker, DependenciaIndisponivel, InjetorFalhas, Prazo
+from gravador import Gravador, chamada, etapa
 
 # ==== CONFIGURAÇÃO ====  
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
-groq_client = Groq(api_key=GROQ_API_KEY)
+# Prazo total de cada /ia e teto de cada chamada externa (segundos)
+IA_PRAZO_S = float(os.getenv("IA_PRAZO_S", 8))
+SUPABASE_TIMEOUT_S = float(os.getenv("SUPABASE_TIMEOUT_S", 3))
+GROQ_TIMEOUT_S = float(os.getenv("GROQ_TIMEOUT_S", 6))
+
+supabase = create_client(
+    SUPABASE_URL, SUPABASE_KEY,
+    options=ClientOptions(postgrest_client_timeout=SUPABASE_TIMEOUT_S)
+)
+# Sem retries internos: quem decide repetir/desistir é o breaker + prazo
+groq_client = Groq(api_key=GROQ_API_KEY, max_retries=0)
+
+# Um breaker por dependência; FALHAS_SUPABASE / FALHAS_GROQ injetam falhas locais
+cb_supabase = CircuitBreaker(
+    "supabase",
+    limite_falhas=int(os.getenv("CB_LIMITE_FALHAS", 5)),
+    tempo_reset_s=float(os.getenv("CB_RESET_S", 30)),
+    max_chamadas=int(os.getenv("CB_MAX_CHAMADAS", 16)),
+    injetor=InjetorFalhas.de_env("FALHAS_SUPABASE")
+)
+cb_groq = CircuitBreaker(
+    "groq",
+    limite_falhas=int(os.getenv("CB_LIMITE_FALHAS", 5)),
+    tempo_reset_s=float(os.getenv("CB_RESET_S", 30)),
+    max_chamadas=int(os.getenv("CB_MAX_CHAMADAS", 16)),
+    injetor=InjetorFalhas.de_env("FALHAS_GROQ")
+)
+
+# Gravação amostrada de tráfego /ia para replay (IA_GRAVAR / IA_GRAVAR_AMOSTRA)
+gravador_ia = Gravador.de_env()
 
 app = Flask(__name__)
 # Permite chamadas CORS ao endpoint /ia
@@ -46,6 +76,14 @@ ASK_TIME_TEMPLATES = [
     "Posso confirmar sua remarcação para {date}? Se sim, informe também o horário. 😉",
 ]
 
+INDISPONIVEL_TEMPLATES = [
+    "Estamos com instabilidade no momento. 😕 Tente novamente em alguns minutos ou use o app.",
+    "Não consegui acessar sua agenda agora. Pode tentar de novo daqui a pouco?"
+]
+IA_INDISPONIVEL_TEMPLATES = [
+    "Não consegui processar sua mensagem agora. Informe o dia desejado (ex.: 12/06) ou responda com sim ou não. 😉",
+]
+
 REMINDER_TEMPLATES = [
     "Claro! No dia {date} vou te lembrar de {task}.",
     "Combinado! Em {date}, você receberá um lembrete para {task}.",
@@ -55,6 +93,35 @@ REMINDER_TEMPLATES = [
 
 # ==== FUNÇÕES AUXILIARES ====  
 
+def relogio_agora(tzinfo):
+    """Hora atual; o replay substitui para reproduzir a data da gravação"""
+    return datetime.now(tz=tzinfo)
+
+def captura_atual():
+    """Captura da requisição /ia corrente, se ela foi amostrada para gravação"""
+    return g.get("captura") if has_request_context() else None
+
+def prazo_atual():
+    """Prazo da requisição /ia corrente (None fora de uma requisição)"""
+    return g.get("prazo") if has_request_context() else None
+
+def executar_supabase(consulta, escrita=False):
+    """
+    Executa uma query do Supabase sob o breaker e o prazo da requisição.
+    Escritas ficam fora do prazo e não são abandonadas no meio: valem só o breaker e
+    o timeout do cliente HTTP (SUPABASE_TIMEOUT_S). Assim a resposta final (inclusive
+    o template de instabilidade) sempre vai para mensagens_chat, mesmo com o prazo
+    já gasto por leituras ou pelo Groq.
+    """
+    with chamada(captura_atual(), "supabase") as registrar:
+        res = cb_supabase.chamar(
+            lambda timeout: consulta.execute(),
+            prazo=None if escrita else prazo_atual(),
+            teto_s=SUPABASE_TIMEOUT_S, abandonar=not escrita
+        )
+        registrar(None if res is None else {"data": res.data})
+    return res
+
 def fmt_data(dt: date) -> str:
     """Formata data para '29 de maio'"""
     return f"{dt.day} de {MESES_PT[dt.month]}"
@@ -79,7 +146,7 @@ def extrair_data_hora(texto: str):
 
     # base de datas
     timezone = tz.gettz('America/Toronto')
-    agora_dt = datetime.now(tz=timezone)
+    agora_dt = relogio_agora(timezone)
     hoje = agora_dt.date()
 
     # 1) Expressões relativas
@@ -177,15 +244,15 @@ def gravar_mensagem_chat(user_id, mensagem, agendamento_id, tipo="IA"):
     # Define o timezone de Toronto
     timezone = tz.gettz('America/Toronto')
     # Usa a hora local com microssegundos
-    agora = datetime.now(tz=timezone).isoformat()
+    agora = relogio_agora(timezone).isoformat()
     try:
-        supabase.table("mensagens_chat").insert({
+        executar_supabase(supabase.table("mensagens_chat").insert({
             "user_id":        user_id,
             "mensagem":       mensagem,
             "agendamento_id": agendamento_id,
             "data_envio":     agora,
             "tipo":           tipo
-        }).execute()
+        }), escrita=True)
         app.logger.info(f"💬 Mensagem gravada no chat: '{mensagem}' às {agora}")
     except Exception as e:
         app.logger.error(f"❌ Erro ao gravar chat: {e}")
@@ -193,19 +260,22 @@ def gravar_mensagem_chat(user_id, mensagem, agendamento_id, tipo="IA"):
 
 def buscar_agendamento(cod_id):
     try:
-        res = supabase.table("agendamentos") \
+        res = executar_supabase(
+            supabase.table("agendamentos")
             .select(
                 "date, horas, nova_data, nova_hora, reagendando, status, "
                 "sms_3dias, company_id, atend_id, chat_ativo"
-            ) \
-            .eq("cod_id", int(cod_id)) \
-            .maybe_single() \
-            .execute()
+            )
+            .eq("cod_id", int(cod_id))
+            .maybe_single()
+        )
 
         dados = res.data or {}
         app.logger.info(f"🔍 Dados do agendamento: {dados}")
         return dados
 
+    except DependenciaIndisponivel:
+        raise
     except Exception as e:
         app.logger.error(f"❌ Erro ao buscar agendamento: {e}")
         return {}
@@ -215,16 +285,20 @@ def buscar_agendamento(cod_id):
 def consultar_disponibilidade(company_id, atend_id, nova_data):
     try:
         app.logger.info(f"🔍 consultando disponibilidade para company_id={company_id}, atend_id={atend_id}, date={nova_data}")
-        res = supabase.table("view_horas_disponiveis") \
-            .select("horas_disponiveis") \
-            .eq("company_id", company_id) \
-            .eq("atend_id", atend_id) \
-            .eq("date", nova_data) \
-            .maybe_single().execute()
+        res = executar_supabase(
+            supabase.table("view_horas_disponiveis")
+            .select("horas_disponiveis")
+            .eq("company_id", company_id)
+            .eq("atend_id", atend_id)
+            .eq("date", nova_data)
+            .maybe_single()
+        )
         dispo = res.data or {}
         slots = dispo.get("horas_disponiveis", {}).get("disponiveis", [])
         app.logger.info(f"✅ disponibilidade retornada: {slots}")
         return dispo
+    except DependenciaIndisponivel:
+        raise
     except Exception as e:
         app.logger.error(f"❌ Erro na disponibilidade: {e}")
         return {}
@@ -233,15 +307,25 @@ def consultar_disponibilidade(company_id, atend_id, nova_data):
 def gerar_resposta_ia(mensagens):
     try:
         app.logger.info(f"💭 Prompt IA:\n{mensagens}")
-        resp = groq_client.chat.completions.create(
-            model="llama3-8b-8192",
-            messages=mensagens,
-            temperature=0.7,
-            max_tokens=400
-        )
+        with chamada(captura_atual(), "groq") as registrar:
+            resp = cb_groq.chamar(
+                lambda timeout: groq_client.chat.completions.create(
+                    model="llama3-8b-8192",
+                    messages=mensagens,
+                    temperature=0.7,
+                    max_tokens=400,
+                    timeout=timeout
+                ),
+                prazo=prazo_atual(),
+                teto_s=GROQ_TIMEOUT_S
+            )
+            registrar({"mensagem": resp.choices[0].message.content})
         resposta = resp.choices[0].message.content.strip()
         app.logger.info(f"💡 Resposta do Groq: {resposta}")
         return resposta
+    except DependenciaIndisponivel as e:
+        app.logger.warning(f"⚡ Groq indisponível, usando template: {e}")
+        return random.choice(IA_INDISPONIVEL_TEMPLATES)
     except Exception as e:
         app.logger.error(f"❌ Erro no Groq: {e}")
         return "Desculpe, ocorreu um problema. Pode tentar novamente?"
@@ -249,6 +333,35 @@ def gerar_resposta_ia(mensagens):
 # ==== ROTA PRINCIPAL ====  
 @app.route("/ia", methods=["POST"])
 def handle_ia():
+    # Orçamento de tempo compartilhado por todas as chamadas externas desta requisição
+    g.prazo = Prazo(IA_PRAZO_S)
+    g.captura = gravador_ia.amostrar(relogio_agora(tz.gettz('America/Toronto')).isoformat()) if gravador_ia else None
+    with etapa(g.captura, "total"):
+        try:
+            resultado = processar_ia()
+        except DependenciaIndisponivel as e:
+            # Supabase fora/lento: responde na hora com template em vez de segurar o worker
+            app.logger.warning(f"⚡ Dependência indisponível em /ia: {e}")
+            resposta = random.choice(INDISPONIVEL_TEMPLATES)
+            agendamento_id = (request.get_json(force=True, silent=True) or {}).get("agendamento_id")
+            if agendamento_id:
+                gravar_mensagem_chat(user_id="ia", mensagem=resposta, agendamento_id=agendamento_id)
+            resultado = {"resposta": resposta}, 200
+        with etapa(g.captura, "serializacao"):
+            resp = app.make_response(resultado)
+
+    if g.captura:
+        try:
+            gravador_ia.gravar(
+                g.captura, request.get_json(force=True, silent=True),
+                resp.status_code, resp.get_json(silent=True)
+            )
+        except Exception as e:
+            app.logger.error(f"❌ Erro ao gravar captura: {e}")
+    return resp
+
+
+def processar_ia():
     # Responde ao preflight CORS
     if request.method == "OPTIONS":
         return "", 200
@@ -334,13 +447,13 @@ def handle_ia():
         )
     
         # Atualiza agendamento e fecha o chat
-        supabase.table("agendamentos").update({
+        executar_supabase(supabase.table("agendamentos").update({
             "date":       dados["nova_data"],
             "horas":      dados["nova_hora"],
             "status":     "Reagendado",
             "reagendando": False,
             "chat_ativo": False
-        }).eq("cod_id", int(agendamento_id)).execute()
+        }).eq("cod_id", int(agendamento_id)), escrita=True)
         app.logger.info("♻️ Gravação da confirmação no banco (chat encerrado)")
     
         # Grava no chat e retorna
@@ -356,10 +469,10 @@ def handle_ia():
     # 4) Confirmação negativa (N / não / no / non)
     elif mensagem in ["n", "não", "no", "non"]:
         resposta = "Tranquilo! Qual outro dia e horário funcionam melhor pra você? 😉"
-        supabase.table("agendamentos").update({
+        executar_supabase(supabase.table("agendamentos").update({
             "nova_data": None,
             "nova_hora": None
-        }).eq("cod_id", int(agendamento_id)).execute()
+        }).eq("cod_id", int(agendamento_id)), escrita=True)
         app.logger.info(f"♻️ Reset slots no agendamento {agendamento_id}")
 
         # grava & retorna
@@ -390,12 +503,12 @@ def handle_ia():
 
         # fluxo normal de reagendamento
         resposta = "Claro! Qual dia funciona melhor para marcarmos?"
-        supabase.table("agendamentos").update({
+        executar_supabase(supabase.table("agendamentos").update({
             "reagendando": True,
             "nova_data":   None,
             "nova_hora":   None,
             "chat_ativo":  True
-        }).eq("cod_id", int(agendamento_id)).execute()
+        }).eq("cod_id", int(agendamento_id)), escrita=True)
         app.logger.info(f"♻️ Iniciando reagendamento no agendamento {agendamento_id}")
 
         # grava & retorna
@@ -419,14 +532,15 @@ def handle_ia():
 
         # 6b) Extrai data e hora juntos
         else:
-            nova_data, nova_hora = extrair_data_hora(mensagem)
+            with etapa(captura_atual(), "parser"):
+                nova_data, nova_hora = extrair_data_hora(mensagem)
 
         # 7) Se vier data+hora, grava e pergunta confirmação
         if nova_data and nova_hora:
-            supabase.table("agendamentos").update({
+            executar_supabase(supabase.table("agendamentos").update({
                 "nova_data": nova_data.isoformat(),
                 "nova_hora": nova_hora.strftime("%H:%M:%S")
-            }).eq("cod_id", int(agendamento_id)).execute()
+            }).eq("cod_id", int(agendamento_id)), escrita=True)
             resposta = (
                 f"🔐 Posso confirmar a remarcação para {fmt_data(nova_data)} "
                 f"às {nova_hora.strftime('%H:%M')}? Responda com sim ou não."
@@ -435,10 +549,10 @@ def handle_ia():
 
         # 8) Se vier só data, grava e lista horários disponíveis
         elif nova_data:
-            supabase.table("agendamentos").update({
+            executar_supabase(supabase.table("agendamentos").update({
                 "nova_data": nova_data.isoformat(),
                 "nova_hora": None
-            }).eq("cod_id", int(agendamento_id)).execute()
+            }).eq("cod_id", int(agendamento_id)), escrita=True)
             app.logger.info(f"♻️ Gravado nova_data {nova_data} (sem hora)")
 
             disponiveis = consultar_disponibilidade(
@@ -482,15 +596,13 @@ def handle_ia():
                 return {"resposta": resposta}, 200
     
             # 10) Se estivermos em reagendamento (chat_ativo == True e sms_3dias == True), cai no LLM
-            historico = (
+            historico = executar_supabase(
                 supabase.table("mensagens_chat")
                 .select("mensagem,tipo")
                 .eq("agendamento_id", int(agendamento_id))
                 .order("data_envio", desc=False)
                 .limit(10)
-                .execute()
-                .data
-            )
+            ).data
             msgs = [
                 {"role": "assistant" if m["tipo"] == "IA" else "user", "content": m["mensagem"]}
                 for m in historico
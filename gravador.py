@@ -0,0 +1,149 @@
+import os, json, hashlib, random, re, threading, time
+from contextlib import contextmanager, nullcontext
+
+# Campos que identificam pessoas: gravados só como hash
+CHAVES_SENSIVEIS = {"user_id", "name", "name_user", "phone", "user_phone", "nome_atendente", "company_name"}
+RE_EMAIL = re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+")
+# Sequências numéricas com separadores; só mascaradas se tiverem 10+ dígitos (telefones, não datas)
+RE_NUMERO_LONGO = re.compile(r"(?<![\d:/])\+?[\d(][\d\s().-]{6,}\d(?![\d:/])")
+
+# Campos de texto livre (mensagem do usuário, histórico, saída do Groq)
+CHAVES_TEXTO = {"mensagem", "resposta"}
+# Modos para o texto livre (IA_GRAVAR_TEXTO):
+#   tokens - só ficam números/datas/horas e as palavras que o parser e os intents usam;
+#            as demais viram "xxxx" do mesmo tamanho (padrão)
+#   bruto  - texto do usuário gravado como veio, só com e-mails/telefones mascarados
+#   omitir - texto livre gravado vazio (o replay só reproduz os caminhos de erro/timing)
+MODOS_TEXTO = {"tokens", "bruto", "omitir"}
+PALAVRAS_PARSER = {
+    "hoje", "amanhã", "depois", "de", "da", "do", "dia", "às", "as", "a", "h", "hs", "horas",
+    "próxima", "próximo", "semana", "feira", "segunda", "terça", "quarta", "quinta", "sexta",
+    "sábado", "domingo", "janeiro", "fevereiro", "março", "abril", "maio", "junho", "julho",
+    "agosto", "setembro", "outubro", "novembro", "dezembro",
+    "sim", "não", "ok", "y", "yes", "n", "no", "non", "oui", "r", "disponível", "vagas",
+}
+RE_PALAVRA = re.compile(r"[^\W\d_]+")
+
+
+def _hash(valor) -> str:
+    return "h:" + hashlib.sha256(str(valor).encode()).hexdigest()[:12]
+
+def _mascara_numero(m):
+    return "<tel>" if sum(c.isdigit() for c in m.group()) >= 10 else m.group()
+
+def _mascara_palavra(m):
+    palavra = m.group()
+    return palavra if palavra.lower() in PALAVRAS_PARSER else "x" * len(palavra)
+
+def sanitizar(valor, chave=None, texto="tokens"):
+    """Remove dados pessoais mantendo o que o parser precisa (datas, horas, ids de agendamento)"""
+    if isinstance(valor, dict):
+        return {k: sanitizar(v, k, texto) for k, v in valor.items()}
+    if isinstance(valor, list):
+        return [sanitizar(v, None, texto) for v in valor]
+    if valor is None:
+        return None
+    if chave in CHAVES_SENSIVEIS:
+        return _hash(valor)
+    if isinstance(valor, str):
+        if chave in CHAVES_TEXTO:
+            if texto == "omitir":
+                return ""
+            if texto == "tokens":
+                valor = RE_PALAVRA.sub(_mascara_palavra, valor)
+        return RE_NUMERO_LONGO.sub(_mascara_numero, RE_EMAIL.sub("<email>", valor))
+    return valor
+
+
+class Captura:
+    """Tudo que uma requisição /ia amostrada produziu: respostas externas e tempos por etapa."""
+
+    def __init__(self, agora: str, texto: str = "tokens"):
+        self.agora = agora
+        self.texto = texto
+        self.upstream = []
+        self.etapas = {}
+
+    @contextmanager
+    def etapa(self, nome):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            ms = (time.perf_counter() - inicio) * 1000
+            self.etapas[nome] = round(self.etapas.get(nome, 0.0) + ms, 3)
+
+    @contextmanager
+    def chamada(self, dep):
+        """Registra resposta (ou erro) de uma dependência; o bloco chama registrar(dados)"""
+        item = {"dep": dep}
+        self.upstream.append(item)
+        with self.etapa(dep):
+            inicio = time.perf_counter()
+            try:
+                yield lambda dados: item.update(dados=sanitizar(dados, texto=self.texto))
+            except Exception as e:
+                item["erro"] = type(e).__name__
+                raise
+            finally:
+                item["ms"] = round((time.perf_counter() - inicio) * 1000, 3)
+
+
+def etapa(captura, nome):
+    return captura.etapa(nome) if captura else nullcontext()
+
+def chamada(captura, dep):
+    return captura.chamada(dep) if captura else nullcontext(lambda dados: None)
+
+
+class Gravador:
+    """
+    Grava requisições /ia amostradas em JSONL compacto (uma linha por requisição).
+    Ativado por IA_GRAVAR=<arquivo>; IA_GRAVAR_AMOSTRA define a fração gravada e
+    IA_GRAVAR_TEXTO o que sobra do texto livre (ver MODOS_TEXTO). Com "bruto" a
+    captura guarda o texto digitado pelos usuários: trate o arquivo como dado pessoal.
+    """
+
+    def __init__(self, caminho: str, amostra: float = 0.1, texto: str = "tokens"):
+        if texto not in MODOS_TEXTO:
+            raise ValueError(f"IA_GRAVAR_TEXTO inválido: {texto!r} (use {', '.join(sorted(MODOS_TEXTO))})")
+        self.caminho = caminho
+        self.amostra = amostra
+        self.texto = texto
+        # RNG próprio: não mexe no random global usado na escolha dos templates
+        self._rng = random.Random()
+        self._lock = threading.Lock()
+        self._arquivo = open(caminho, "a", encoding="utf-8") if caminho else None
+
+    @classmethod
+    def de_env(cls):
+        caminho = os.getenv("IA_GRAVAR")
+        if not caminho:
+            return None
+        return cls(
+            caminho,
+            amostra=float(os.getenv("IA_GRAVAR_AMOSTRA", 0.1)),
+            texto=os.getenv("IA_GRAVAR_TEXTO", "tokens")
+        )
+
+    def amostrar(self, agora: str):
+        """Nova Captura se esta requisição cair na amostra, senão None"""
+        if self._rng.random() >= self.amostra:
+            return None
+        return Captura(agora, self.texto)
+
+    def gravar(self, captura: Captura, payload, status: int, resposta):
+        registro = {
+            "ts": captura.agora,
+            "texto": self.texto,
+            "payload": sanitizar(payload, texto=self.texto),
+            "upstream": captura.upstream,
+            "etapas": captura.etapas,
+            "status": status,
+            "resposta": sanitizar(resposta, texto=self.texto),
+        }
+        linha = json.dumps(registro, ensure_ascii=False, separators=(",", ":"), default=str)
+        with self._lock:
+            self._arquivo.write(linha + "\n")
+            self._arquivo.flush()
+        return registro
@@ -0,0 +1,76 @@
+from datetime import datetime, timedelta
+import os, logging, json, zlib, argparse
+
+# Margens de sobreposição da marca d'água: cod_ids/alterações que commitam fora de ordem
+# caem dentro da margem e são reexaminados (a reserva em sms_3dias evita envio duplo)
+MARGEM_COD_ID = int(os.getenv("LEMBRETES_MARGEM_COD_ID", 200))
+MARGEM_ATUALIZACAO_S = float(os.getenv("LEMBRETES_MARGEM_ATUALIZACAO_S", 300))
+
+
+def parse_shard(valor):
+    """'i/N' -> (i, N), com 0 <= i < N"""
+    try:
+        i, n = map(int, valor.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"shard inválido: {valor!r} (use i/N)")
+    if n < 1 or not 0 <= i < n:
+        raise argparse.ArgumentTypeError(f"shard fora do intervalo: {valor!r}")
+    return i, n
+
+def shard_do_usuario(user_id, total):
+    # crc32 é estável entre processos (hash() do Python não é)
+    return zlib.crc32(str(user_id).encode()) % total
+
+def caminho_checkpoint(base, shard):
+    i, n = shard
+    if n == 1:
+        return base
+    raiz, ext = os.path.splitext(base)
+    return f"{raiz}.{i}-de-{n}{ext}"
+
+def carrega_checkpoint(caminho):
+    try:
+        with open(caminho) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logging.warning(f"⚠️ Checkpoint ilegível ({caminho}), fazendo varredura completa: {e}")
+        return None
+
+def salva_checkpoint(caminho, dados):
+    tmp = f"{caminho}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(dados, f)
+    os.replace(tmp, caminho)
+
+def filtros_incrementais(marca, coluna_atualizacao,
+                         margem_cod_id=MARGEM_COD_ID, margem_s=MARGEM_ATUALIZACAO_S):
+    """
+    Filtro `or` do PostgREST para o modo incremental: cod_ids novos, linhas alteradas,
+    o que entrou na janela desde a última execução e o que ficou pendente.
+    """
+    filtros = [
+        f"cod_id.gt.{max(0, marca['max_cod_id'] - margem_cod_id)}",
+        f"date.gt.{marca['fim']}"
+    ]
+    if marca.get("atualizado_em"):
+        desde = datetime.fromisoformat(marca["atualizado_em"]) - timedelta(seconds=margem_s)
+        filtros.append(f"{coluna_atualizacao}.gt.{desde.isoformat()}")
+    if marca.get("pendentes"):
+        filtros.append(f"cod_id.in.({','.join(map(str, marca['pendentes']))})")
+    return ",".join(filtros)
+
+def nova_marca(marca, linhas, fim, pendentes, coluna_atualizacao):
+    """Marca d'água depois de processar `linhas` (nunca anda para trás)"""
+    marca = marca or {}
+    cod_ids = [ag["cod_id"] for ag in linhas] + [marca.get("max_cod_id", 0)]
+    datas = [datetime.fromisoformat(ag[coluna_atualizacao]) for ag in linhas if ag.get(coluna_atualizacao)]
+    if marca.get("atualizado_em"):
+        datas.append(datetime.fromisoformat(marca["atualizado_em"]))
+    return {
+        "max_cod_id": max(cod_ids),
+        "fim": fim.isoformat(),
+        "atualizado_em": max(datas).isoformat() if datas else None,
+        "pendentes": sorted(pendentes)
+    }
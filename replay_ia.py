@@ -0,0 +1,229 @@
+"""
+Replay de capturas do /ia (geradas com IA_GRAVAR) contra Supabase/Groq simulados.
+
+    python replay_ia.py captura.jsonl --perfil cprofile --saida ia.prof
+    python replay_ia.py captura.jsonl --perfil amostragem --saida ia.folded   # flamegraph.pl / speedscope
+    python replay_ia.py captura.jsonl --perfil tracemalloc
+"""
+import os, sys, json, argparse, random, cProfile, pstats, threading, time, tracemalloc
+from collections import Counter, deque
+from datetime import datetime
+from types import SimpleNamespace
+
+# O app cria os clientes no import: credenciais falsas, nada sai da máquina
+os.environ.pop("IA_GRAVAR", None)
+os.environ.setdefault("SUPABASE_URL", "http://replay.invalid")
+os.environ.setdefault("SUPABASE_KEY", "replay.replay.replay")
+os.environ.setdefault("GROQ_API_KEY", "replay")
+
+import app as ia
+import resiliencia
+from gravador import Gravador
+
+
+class ConsultaGravada:
+    """Aceita qualquer cadeia do query builder; execute() devolve a próxima resposta gravada"""
+
+    def __init__(self, replay):
+        self._replay = replay
+
+    def __getattr__(self, nome):
+        return lambda *args, **kwargs: self
+
+    def execute(self):
+        item = self._replay.proximo("supabase")
+        if item is None:
+            return SimpleNamespace(data=[])
+        dados = item.get("dados")
+        return None if dados is None else SimpleNamespace(data=dados.get("data"))
+
+
+class SupabaseGravado:
+    def __init__(self, replay):
+        self._replay = replay
+
+    def table(self, nome):
+        return ConsultaGravada(self._replay)
+
+
+class GroqGravado:
+    def __init__(self, replay):
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+        self._replay = replay
+
+    def _create(self, **kwargs):
+        item = self._replay.proximo("groq")
+        conteudo = ((item or {}).get("dados") or {}).get("mensagem") or ""
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=conteudo))])
+
+
+class Replay:
+    """Serve as respostas externas de um registro na ordem em que foram gravadas"""
+
+    def __init__(self):
+        self.filas = {}
+        self.divergencias = 0
+
+    def carregar(self, registro):
+        self.filas = {"supabase": deque(), "groq": deque()}
+        for item in registro.get("upstream", []):
+            self.filas.setdefault(item["dep"], deque()).append(item)
+
+    def proximo(self, dep):
+        fila = self.filas.get(dep)
+        if not fila:
+            # o código seguiu outro caminho que o da gravação
+            self.divergencias += 1
+            return None
+        item = fila.popleft()
+        if "erro" in item:
+            erro = getattr(resiliencia, item["erro"], None)
+            if not (isinstance(erro, type) and issubclass(erro, Exception)):
+                erro = RuntimeError
+            raise erro(f"erro gravado: {item['erro']}")
+        return item
+
+
+class GravadorMemoria(Gravador):
+    """Coleta os tempos por etapa do replay sem escrever em disco"""
+
+    def __init__(self):
+        super().__init__(caminho=None, amostra=1.0)
+        self.registros = []
+
+    def gravar(self, captura, payload, status, resposta):
+        self.registros.append({"etapas": captura.etapas, "status": status})
+
+
+class Amostrador:
+    """Profiler por amostragem da thread principal; gera pilhas no formato 'collapsed'"""
+
+    def __init__(self, intervalo_s=0.001):
+        self.intervalo_s = intervalo_s
+        self.pilhas = Counter()
+        self._alvo = threading.get_ident()
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._rodar, daemon=True)
+
+    def _rodar(self):
+        while not self._parar.wait(self.intervalo_s):
+            frame = sys._current_frames().get(self._alvo)
+            pilha = []
+            while frame is not None:
+                codigo = frame.f_code
+                pilha.append(f"{codigo.co_name} ({os.path.basename(codigo.co_filename)}:{codigo.co_firstlineno})")
+                frame = frame.f_back
+            self.pilhas[";".join(reversed(pilha))] += 1
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._parar.set()
+        self._thread.join()
+
+    def salvar(self, caminho):
+        with open(caminho, "w", encoding="utf-8") as f:
+            for pilha, n in self.pilhas.most_common():
+                f.write(f"{pilha} {n}\n")
+
+
+def carregar_captura(caminho):
+    with open(caminho, encoding="utf-8") as f:
+        return [json.loads(linha) for linha in f if linha.strip()]
+
+
+def percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(p / 100 * len(valores)))] if valores else 0.0
+
+
+def resumo_etapas(titulo, registros):
+    por_etapa = {}
+    for reg in registros:
+        for nome, ms in reg.get("etapas", {}).items():
+            por_etapa.setdefault(nome, []).append(ms)
+    print(f"\n{titulo}")
+    print(f"{'etapa':<14}{'n':>6}{'média ms':>12}{'p50 ms':>10}{'p99 ms':>10}")
+    for nome, valores in sorted(por_etapa.items()):
+        print(f"{nome:<14}{len(valores):>6}{sum(valores) / len(valores):>12.3f}"
+              f"{percentil(valores, 50):>10.3f}{percentil(valores, 99):>10.3f}")
+
+
+def rodar(registros, repeticoes, semente):
+    """Reexecuta cada registro pelo Flask, com relógio, random e dependências fixados"""
+    replay = Replay()
+    ia.supabase = SupabaseGravado(replay)
+    ia.groq_client = GroqGravado(replay)
+    gravador = GravadorMemoria()
+    ia.gravador_ia = gravador
+    cliente = ia.app.test_client()
+
+    for _ in range(repeticoes):
+        for registro in registros:
+            replay.carregar(registro)
+            agora = datetime.fromisoformat(registro["ts"])
+            ia.relogio_agora = lambda tzinfo, agora=agora: agora.astimezone(tzinfo)
+            random.seed(semente)
+            # o estado dos breakers de um registro não vaza para o próximo
+            ia.cb_supabase.reiniciar()
+            ia.cb_groq.reiniciar()
+            cliente.post("/ia", json=registro["payload"])
+    return gravador.registros, replay.divergencias
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay de capturas do /ia com profiling")
+    parser.add_argument("captura", help="arquivo JSONL gerado com IA_GRAVAR")
+    parser.add_argument("--perfil", choices=["nenhum", "cprofile", "amostragem", "tracemalloc"], default="nenhum")
+    parser.add_argument("--saida", help="arquivo de saída do profiler (.prof para cprofile, pilhas 'collapsed' para amostragem)")
+    parser.add_argument("--repeticoes", type=int, default=1, help="quantas vezes reexecutar a captura inteira")
+    parser.add_argument("--semente", type=int, default=0, help="semente do random (escolha de templates)")
+    parser.add_argument("--top", type=int, default=25, help="linhas no relatório do profiler")
+    args = parser.parse_args(argv)
+
+    registros = carregar_captura(args.captura)
+    omitidos = sum(1 for reg in registros if reg.get("texto") == "omitir")
+    if omitidos:
+        print(f"⚠️ {omitidos} registro(s) gravados com IA_GRAVAR_TEXTO=omitir: sem texto, o replay não segue o caminho original")
+    ia.app.logger.setLevel("WARNING")
+    print(f"▶️ Reexecutando {len(registros)} requisição(ões) x {args.repeticoes}")
+
+    inicio = time.perf_counter()
+    if args.perfil == "cprofile":
+        perfil = cProfile.Profile()
+        resultados, divergencias = perfil.runcall(rodar, registros, args.repeticoes, args.semente)
+        stats = pstats.Stats(perfil).sort_stats("cumulative")
+        stats.print_stats(args.top)
+        if args.saida:
+            stats.dump_stats(args.saida)
+    elif args.perfil == "amostragem":
+        with Amostrador() as amostrador:
+            resultados, divergencias = rodar(registros, args.repeticoes, args.semente)
+        for pilha, n in amostrador.pilhas.most_common(args.top):
+            print(f"{n:>6}  {pilha.rsplit(';', 1)[-1]}")
+        if args.saida:
+            amostrador.salvar(args.saida)
+    elif args.perfil == "tracemalloc":
+        tracemalloc.start(25)
+        resultados, divergencias = rodar(registros, args.repeticoes, args.semente)
+        foto = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        for stat in foto.statistics("lineno")[:args.top]:
+            print(stat)
+        if args.saida:
+            foto.dump(args.saida)
+    else:
+        resultados, divergencias = rodar(registros, args.repeticoes, args.semente)
+    duracao = time.perf_counter() - inicio
+
+    resumo_etapas("⏱️ Produção (gravado)", registros)
+    resumo_etapas("⏱️ Replay", resultados)
+    print(f"\n✅ {len(resultados)} requisição(ões) em {duracao:.3f}s; {divergencias} divergência(s) de caminho")
+    if args.saida and args.perfil != "nenhum":
+        print(f"💾 Perfil salvo em {args.saida}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+import os, logging, random, threading, time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturoTimeout
+
+# Erros de transporte (httpx, groq) reconhecidos pelo nome da classe, sem importar os clientes
+ERROS_TRANSPORTE = {"TransportError", "TimeoutException", "APIConnectionError", "APITimeoutError"}
+# Códigos do PostgREST para "não consegui falar com o Postgres"
+CODIGOS_PGRST_CONEXAO = {"PGRST000", "PGRST001", "PGRST002", "PGRST003"}
+
+
+def falha_de_dependencia(erro: Exception) -> bool:
+    """
+    True só para erros que indicam dependência doente: timeout, conexão, HTTP 5xx
+    ou SQLSTATE classe 5x. Erros do chamador (4xx, constraint, filtro inválido) não contam.
+    """
+    if isinstance(erro, (TimeoutError, ConnectionError)):
+        return True
+    if any(cls.__name__ in ERROS_TRANSPORTE for cls in type(erro).__mro__):
+        return True
+    status = getattr(erro, "status_code", None)
+    if status is None:
+        status = getattr(getattr(erro, "response", None), "status_code", None)
+    if isinstance(status, int):
+        return status >= 500
+    codigo = str(getattr(erro, "code", "") or "")
+    return codigo.startswith("5") or codigo in CODIGOS_PGRST_CONEXAO
+
+
+class DependenciaIndisponivel(Exception):
+    """Dependência externa não respondeu dentro do prazo ou está com o circuito aberto."""
+
+
+class PrazoEsgotado(DependenciaIndisponivel):
+    pass
+
+
+class CircuitoAberto(DependenciaIndisponivel):
+    pass
+
+
+class DependenciaSaturada(DependenciaIndisponivel):
+    """Todas as vagas de chamada da dependência estão ocupadas"""
+
+
+class Prazo:
+    """Orçamento de tempo de uma requisição, compartilhado por todas as chamadas externas."""
+
+    def __init__(self, orcamento_s: float, relogio=time.monotonic):
+        self._relogio = relogio
+        self.limite = relogio() + orcamento_s
+
+    def restante(self) -> float:
+        return max(0.0, self.limite - self._relogio())
+
+    def fatia(self, teto_s: float = None) -> float:
+        """Tempo disponível para a próxima chamada (limitado por teto_s)."""
+        restante = self.restante()
+        if restante <= 0:
+            raise PrazoEsgotado("prazo da requisição esgotado")
+        return restante if teto_s is None else min(restante, teto_s)
+
+
+class InjetorFalhas:
+    """
+    Simula uma dependência degradada, para testar prazos e breakers localmente.
+    Configurado por variável de ambiente, ex.: FALHAS_GROQ="latencia=6,erro=0.3"
+    """
+
+    def __init__(self, latencia_s: float = 0.0, taxa_erro: float = 0.0, semente=None):
+        self.latencia_s = latencia_s
+        self.taxa_erro = taxa_erro
+        self._rng = random.Random(semente)
+
+    @classmethod
+    def de_env(cls, nome: str):
+        spec = os.getenv(nome)
+        if not spec:
+            return None
+        opcoes = dict(par.split("=", 1) for par in spec.split(",") if "=" in par)
+        return cls(
+            latencia_s=float(opcoes.get("latencia", 0)),
+            taxa_erro=float(opcoes.get("erro", 0)),
+            semente=opcoes.get("semente")
+        )
+
+    def envolver(self, fn):
+        def chamada(timeout):
+            if self.latencia_s:
+                time.sleep(self.latencia_s)
+            if self._rng.random() < self.taxa_erro:
+                raise ConnectionError("falha injetada")
+            return fn(timeout)
+        return chamada
+
+
+class CircuitBreaker:
+    """
+    Breaker por dependência: fechado -> aberto após `limite_falhas` falhas seguidas;
+    depois de `tempo_reset_s` deixa passar UMA chamada de sondagem (meio-aberto).
+    Sucesso na sondagem fecha o circuito, falha reabre.
+    Cada breaker tem o seu pool de `max_chamadas` threads: uma dependência lenta
+    não ocupa as vagas da outra.
+    """
+
+    FECHADO, ABERTO, MEIO_ABERTO = "fechado", "aberto", "meio-aberto"
+
+    def __init__(self, nome: str, limite_falhas: int = 5, tempo_reset_s: float = 30.0,
+                 max_chamadas: int = 16, injetor: InjetorFalhas = None,
+                 eh_falha=falha_de_dependencia, relogio=time.monotonic):
+        self.nome = nome
+        self.limite_falhas = limite_falhas
+        self.tempo_reset_s = tempo_reset_s
+        self.injetor = injetor
+        self.eh_falha = eh_falha
+        self._relogio = relogio
+        self._vagas = threading.BoundedSemaphore(max_chamadas)
+        self._executor = ThreadPoolExecutor(max_workers=max_chamadas, thread_name_prefix=f"upstream-{nome}")
+        self._lock = threading.Lock()
+        self.estado = self.FECHADO
+        self._falhas = 0
+        self._aberto_em = 0.0
+        self._sondando = False
+
+    def _permitir(self) -> bool:
+        with self._lock:
+            if self.estado == self.FECHADO:
+                return True
+            if self.estado == self.ABERTO:
+                if self._relogio() - self._aberto_em < self.tempo_reset_s:
+                    return False
+                self.estado = self.MEIO_ABERTO
+                self._sondando = False
+                logging.info(f"🟡 Circuito {self.nome} meio-aberto: enviando sondagem")
+            if self._sondando:
+                return False
+            self._sondando = True
+            return True
+
+    def _sucesso(self):
+        with self._lock:
+            if self.estado != self.FECHADO:
+                logging.info(f"🟢 Circuito {self.nome} fechado novamente")
+            self.estado = self.FECHADO
+            self._falhas = 0
+            self._sondando = False
+
+    def _falha(self):
+        with self._lock:
+            self._falhas += 1
+            if self.estado == self.MEIO_ABERTO or self._falhas >= self.limite_falhas:
+                if self.estado != self.ABERTO:
+                    logging.warning(f"🔴 Circuito {self.nome} aberto após {self._falhas} falha(s)")
+                self.estado = self.ABERTO
+                self._aberto_em = self._relogio()
+                self._sondando = False
+
+    def reiniciar(self):
+        """Volta ao estado inicial (fechado, sem falhas), mantendo o pool"""
+        with self._lock:
+            self.estado = self.FECHADO
+            self._falhas = 0
+            self._sondando = False
+
+    def _desistir_da_sondagem(self):
+        with self._lock:
+            self._sondando = False
+
+    def chamar(self, fn, prazo: Prazo = None, teto_s: float = None, abandonar: bool = True):
+        """
+        Executa fn(timeout) respeitando o prazo e o estado do circuito.
+        Levanta CircuitoAberto / DependenciaSaturada / PrazoEsgotado sem esperar a dependência.
+
+        abandonar=False (escritas): fn roda na própria thread e só o timeout que ela
+        recebe vale, para não responder "tente de novo" com a escrita ainda em curso.
+        """
+        timeout = prazo.fatia(teto_s) if prazo else teto_s
+        if not self._vagas.acquire(blocking=False):
+            raise DependenciaSaturada(f"{self.nome} sem vagas para novas chamadas")
+        if not self._permitir():
+            self._vagas.release()
+            raise CircuitoAberto(f"circuito {self.nome} aberto")
+
+        if self.injetor:
+            fn = self.injetor.envolver(fn)
+
+        def executar(timeout):
+            try:
+                return fn(timeout)
+            finally:
+                self._vagas.release()
+
+        try:
+            if abandonar:
+                futuro = self._executor.submit(executar, timeout)
+                try:
+                    resultado = futuro.result(timeout=timeout)
+                except FuturoTimeout:
+                    if futuro.cancel():
+                        # nem chegou a rodar: tempo de fila não é falha da dependência
+                        self._vagas.release()
+                        self._desistir_da_sondagem()
+                        raise PrazoEsgotado(f"{self.nome}: chamada não saiu da fila em {timeout:.2f}s")
+                    self._falha()
+                    raise PrazoEsgotado(f"{self.nome} não respondeu em {timeout:.2f}s")
+            else:
+                resultado = executar(timeout)
+        except DependenciaIndisponivel:
+            raise
+        except Exception as e:
+            if self.eh_falha(e):
+                self._falha()
+            else:
+                # erro do chamador: a dependência respondeu, o circuito continua como está
+                self._desistir_da_sondagem()
+            raise
+        self._sucesso()
+        return resultado
@@ -0,0 +1,159 @@
+import os, time
+from types import SimpleNamespace
+
+import pytest
+
+# O app cria os clientes no import: credenciais falsas, nada sai da máquina
+os.environ.pop("IA_GRAVAR", None)
+os.environ.setdefault("SUPABASE_URL", "http://teste.invalid")
+os.environ.setdefault("SUPABASE_KEY", "teste.teste.teste")
+os.environ.setdefault("GROQ_API_KEY", "teste")
+
+import app as ia
+from resiliencia import CircuitBreaker
+
+AGENDAMENTO = {
+    "date": "2025-06-12", "horas": "10:00:00", "nova_data": None, "nova_hora": None,
+    "reagendando": True, "status": "Agendado", "sms_3dias": True,
+    "company_id": 1, "atend_id": 2, "chat_ativo": True,
+}
+PAYLOAD = {"user_id": "u1", "mensagem": "me ajuda por favor", "agendamento_id": 7}
+
+
+class ConsultaFalsa:
+    def __init__(self, banco, tabela):
+        self.banco = banco
+        self.tabela = tabela
+        self.op = "select"
+        self.payload = None
+
+    def insert(self, payload):
+        self.op, self.payload = "insert", payload
+        return self
+
+    def update(self, payload):
+        self.op, self.payload = "update", payload
+        return self
+
+    def __getattr__(self, nome):
+        return lambda *args, **kwargs: self
+
+    def execute(self):
+        return self.banco.executar(self)
+
+
+class SupabaseFalso:
+    """Stand-in local do Supabase: leituras podem ser lentas, escritas ficam registradas"""
+
+    def __init__(self, latencia_leitura=0.0):
+        self.latencia_leitura = latencia_leitura
+        self.escritas = []
+
+    def table(self, nome):
+        return ConsultaFalsa(self, nome)
+
+    def executar(self, consulta):
+        if consulta.op != "select":
+            self.escritas.append((consulta.tabela, consulta.op, consulta.payload))
+            return SimpleNamespace(data=[consulta.payload])
+        time.sleep(self.latencia_leitura)
+        if consulta.tabela == "agendamentos":
+            return SimpleNamespace(data=dict(AGENDAMENTO))
+        if consulta.tabela == "mensagens_chat":
+            return SimpleNamespace(data=[{"mensagem": "Qual dia?", "tipo": "IA"}])
+        return SimpleNamespace(data={"horas_disponiveis": {"disponiveis": []}})
+
+    def mensagens_gravadas(self):
+        return [p["mensagem"] for tabela, op, p in self.escritas if tabela == "mensagens_chat"]
+
+
+class GroqFalso:
+    def __init__(self, resposta="Claro! Qual dia fica melhor?", latencia=0.0):
+        self.chamadas = 0
+        self._resposta = resposta
+        self._latencia = latencia
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, **kwargs):
+        self.chamadas += 1
+        time.sleep(self._latencia)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=self._resposta))])
+
+
+def abrir(cb):
+    def falhar(timeout):
+        raise ConnectionError("fora do ar")
+    for _ in range(cb.limite_falhas):
+        with pytest.raises(ConnectionError):
+            cb.chamar(falhar)
+    assert cb.estado == CircuitBreaker.ABERTO
+
+
+@pytest.fixture
+def cenario(monkeypatch):
+    def montar(supabase=None, groq=None, prazo_s=2.0, supabase_timeout_s=1.0, groq_timeout_s=1.0):
+        supabase = supabase or SupabaseFalso()
+        groq = groq or GroqFalso()
+        monkeypatch.setattr(ia, "supabase", supabase)
+        monkeypatch.setattr(ia, "groq_client", groq)
+        monkeypatch.setattr(ia, "cb_supabase", CircuitBreaker("supabase", limite_falhas=3))
+        monkeypatch.setattr(ia, "cb_groq", CircuitBreaker("groq", limite_falhas=3))
+        monkeypatch.setattr(ia, "IA_PRAZO_S", prazo_s)
+        monkeypatch.setattr(ia, "SUPABASE_TIMEOUT_S", supabase_timeout_s)
+        monkeypatch.setattr(ia, "GROQ_TIMEOUT_S", groq_timeout_s)
+        return supabase, groq, ia.app.test_client()
+    return montar
+
+
+def postar(cliente):
+    inicio = time.monotonic()
+    resp = cliente.post("/ia", json=PAYLOAD)
+    return resp.status_code, resp.get_json()["resposta"], time.monotonic() - inicio
+
+
+def test_fluxo_normal_cai_no_llm_e_grava_a_resposta(cenario):
+    supabase, groq, cliente = cenario()
+    status, resposta, _ = postar(cliente)
+    assert status == 200
+    assert resposta == "Claro! Qual dia fica melhor?"
+    assert supabase.mensagens_gravadas() == [resposta]
+
+
+def test_supabase_aberto_responde_template_sem_esperar(cenario):
+    supabase, groq, cliente = cenario(supabase=SupabaseFalso(latencia_leitura=5))
+    abrir(ia.cb_supabase)
+    status, resposta, duracao = postar(cliente)
+    assert status == 200
+    assert resposta in ia.INDISPONIVEL_TEMPLATES
+    assert duracao < 0.5
+    assert groq.chamadas == 0
+
+
+def test_supabase_lento_esgota_prazo_e_ainda_grava_o_template(cenario):
+    supabase, groq, cliente = cenario(
+        supabase=SupabaseFalso(latencia_leitura=1.0), prazo_s=0.2, supabase_timeout_s=1.0
+    )
+    status, resposta, duracao = postar(cliente)
+    assert resposta in ia.INDISPONIVEL_TEMPLATES
+    assert duracao < 0.6
+    # prazo já zerado: a escrita do template não depende dele
+    assert supabase.mensagens_gravadas() == [resposta]
+
+
+def test_groq_lento_usa_template_e_ainda_grava_a_resposta(cenario):
+    supabase, groq, cliente = cenario(groq=GroqFalso(latencia=1.0), prazo_s=0.3, groq_timeout_s=5.0)
+    status, resposta, duracao = postar(cliente)
+    assert status == 200
+    assert resposta in ia.IA_INDISPONIVEL_TEMPLATES
+    assert duracao < 0.8
+    assert supabase.mensagens_gravadas() == [resposta]
+
+
+def test_groq_aberto_usa_template_sem_chamar(cenario):
+    supabase, groq, cliente = cenario()
+    abrir(ia.cb_groq)
+    status, resposta, duracao = postar(cliente)
+    assert resposta in ia.IA_INDISPONIVEL_TEMPLATES
+    assert duracao < 0.5
+    assert groq.chamadas == 0
+    assert supabase.mensagens_gravadas() == [resposta]
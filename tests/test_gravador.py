@@ -0,0 +1,52 @@
+import json
+
+import pytest
+
+from gravador import Gravador, sanitizar
+
+
+def test_campos_pessoais_viram_hash():
+    dados = sanitizar({"user_id": "abc", "name_user": "Ana", "cod_id": 7})
+    assert dados["user_id"].startswith("h:") and dados["name_user"].startswith("h:")
+    assert dados["cod_id"] == 7
+
+
+def test_modo_tokens_mantem_so_o_que_o_parser_usa():
+    texto = sanitizar({"mensagem": "Oi, sou a Maria, pode ser amanhã às 15:30?"})["mensagem"]
+    assert "Maria" not in texto
+    assert texto == "xx, xxx a xxxxx, xxxx xxx amanhã às 15:30?"
+    assert sanitizar({"mensagem": "próxima sexta-feira 12/06"})["mensagem"] == "próxima sexta-feira 12/06"
+
+
+def test_telefone_e_email_mascarados_datas_mantidas():
+    texto = sanitizar({"mensagem": "liga 514 555 1234 ou ana@x.com dia 2025-06-12 10:00"}, texto="bruto")
+    assert texto["mensagem"] == "liga <tel> ou <email> dia 2025-06-12 10:00"
+
+
+def test_modo_omitir_e_campos_estruturais():
+    linha = {"mensagem": "Olá Ana", "tipo": "IA", "date": "2025-06-12"}
+    assert sanitizar(linha, texto="omitir") == {"mensagem": "", "tipo": "IA", "date": "2025-06-12"}
+
+
+def test_modo_invalido():
+    with pytest.raises(ValueError):
+        Gravador(None, texto="qualquer")
+
+
+def test_gravacao_jsonl(tmp_path):
+    caminho = tmp_path / "captura.jsonl"
+    gravador = Gravador(str(caminho), amostra=1.0)
+    captura = gravador.amostrar("2025-06-10T10:00:00-04:00")
+    with captura.chamada("groq") as registrar:
+        registrar({"mensagem": "Claro, Ana!"})
+    gravador.gravar(captura, {"user_id": "u1", "mensagem": "oi", "agendamento_id": 5}, 200, {"resposta": "ok"})
+
+    registro = json.loads(caminho.read_text())
+    assert registro["texto"] == "tokens"
+    assert registro["payload"]["agendamento_id"] == 5
+    assert registro["upstream"][0]["dados"] == {"mensagem": "xxxxx, xxx!"}
+    assert "groq" in registro["etapas"]
+
+
+def test_amostra_zero_nao_grava():
+    assert Gravador(None, amostra=0.0).amostrar("2025-06-10T10:00:00-04:00") is None
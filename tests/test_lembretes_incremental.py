@@ -0,0 +1,76 @@
+import argparse
+from datetime import date
+
+import pytest
+
+from lembretes_incremental import (
+    caminho_checkpoint, carrega_checkpoint, filtros_incrementais, nova_marca, parse_shard,
+    salva_checkpoint, shard_do_usuario
+)
+
+
+def test_parse_shard():
+    assert parse_shard("0/1") == (0, 1)
+    assert parse_shard("3/4") == (3, 4)
+    for invalido in ["4/4", "-1/4", "1/0", "a/b", "2"]:
+        with pytest.raises(argparse.ArgumentTypeError):
+            parse_shard(invalido)
+
+
+def test_shards_particionam_os_usuarios_sem_sobreposicao():
+    usuarios = [f"user-{i}" for i in range(200)]
+    por_shard = [{u for u in usuarios if shard_do_usuario(u, 4) == i} for i in range(4)]
+    assert set().union(*por_shard) == set(usuarios)
+    assert sum(len(s) for s in por_shard) == len(usuarios)
+    # estável entre chamadas/processos
+    assert shard_do_usuario("user-7", 4) == shard_do_usuario("user-7", 4)
+
+
+def test_caminho_checkpoint_por_shard():
+    assert caminho_checkpoint("ck.json", (0, 1)) == "ck.json"
+    assert caminho_checkpoint("ck.json", (2, 4)) == "ck.2-de-4.json"
+
+
+def test_checkpoint_ida_e_volta(tmp_path):
+    caminho = str(tmp_path / "ck.json")
+    assert carrega_checkpoint(caminho) is None
+
+    linhas = [
+        {"cod_id": 10, "updated_at": "2025-06-10T12:00:00+00:00"},
+        {"cod_id": 12, "updated_at": "2025-06-10T11:00:00+00:00"},
+    ]
+    marca = nova_marca(None, linhas, date(2025, 6, 13), {10}, "updated_at")
+    salva_checkpoint(caminho, marca)
+    assert carrega_checkpoint(caminho) == {
+        "max_cod_id": 12,
+        "fim": "2025-06-13",
+        "atualizado_em": "2025-06-10T12:00:00+00:00",
+        "pendentes": [10],
+    }
+
+
+def test_checkpoint_corrompido_volta_a_varredura_completa(tmp_path):
+    caminho = tmp_path / "ck.json"
+    caminho.write_text("{nao é json")
+    assert carrega_checkpoint(str(caminho)) is None
+
+
+def test_marca_nunca_anda_para_tras():
+    anterior = {"max_cod_id": 50, "atualizado_em": "2025-06-10T12:00:00+00:00"}
+    marca = nova_marca(anterior, [], date(2025, 6, 14), set(), "updated_at")
+    assert marca["max_cod_id"] == 50
+    assert marca["atualizado_em"] == "2025-06-10T12:00:00+00:00"
+
+
+def test_filtros_incrementais_com_margem():
+    marca = {
+        "max_cod_id": 500,
+        "fim": "2025-06-13",
+        "atualizado_em": "2025-06-10T12:00:00+00:00",
+        "pendentes": [3, 7],
+    }
+    filtros = filtros_incrementais(marca, "updated_at", margem_cod_id=100, margem_s=60)
+    assert filtros == (
+        "cod_id.gt.400,date.gt.2025-06-13,"
+        "updated_at.gt.2025-06-10T11:59:00+00:00,cod_id.in.(3,7)"
+    )
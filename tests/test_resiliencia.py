@@ -0,0 +1,162 @@
+import threading, time
+
+import pytest
+
+from resiliencia import (
+    CircuitBreaker, CircuitoAberto, DependenciaSaturada, InjetorFalhas, Prazo, PrazoEsgotado,
+    falha_de_dependencia
+)
+
+
+class Relogio:
+    def __init__(self):
+        self.t = 0.0
+
+    def __call__(self):
+        return self.t
+
+
+class ErroApi(Exception):
+    def __init__(self, code):
+        self.code = code
+
+
+def falhar(timeout):
+    raise ConnectionError("fora do ar")
+
+
+def breaker(**kwargs):
+    relogio = Relogio()
+    kwargs.setdefault("limite_falhas", 2)
+    kwargs.setdefault("tempo_reset_s", 10)
+    return CircuitBreaker("teste", relogio=relogio, **kwargs), relogio
+
+
+def test_abre_apos_limite_de_falhas_e_rejeita_sem_chamar():
+    cb, _ = breaker()
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            cb.chamar(falhar)
+    assert cb.estado == CircuitBreaker.ABERTO
+
+    chamadas = []
+    with pytest.raises(CircuitoAberto):
+        cb.chamar(lambda timeout: chamadas.append(1))
+    assert chamadas == []
+
+
+def test_sondagem_com_sucesso_fecha_o_circuito():
+    cb, relogio = breaker()
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            cb.chamar(falhar)
+    relogio.t = 11
+    assert cb.chamar(lambda timeout: 42) == 42
+    assert cb.estado == CircuitBreaker.FECHADO
+
+
+def test_sondagem_com_falha_reabre_o_circuito():
+    cb, relogio = breaker()
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            cb.chamar(falhar)
+    relogio.t = 11
+    with pytest.raises(ConnectionError):
+        cb.chamar(falhar)
+    assert cb.estado == CircuitBreaker.ABERTO
+    with pytest.raises(CircuitoAberto):
+        cb.chamar(lambda timeout: 42)
+
+
+def test_meio_aberto_deixa_passar_uma_sondagem_por_vez():
+    cb, relogio = breaker()
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            cb.chamar(falhar)
+    relogio.t = 11
+    liberar = threading.Event()
+    sondagem = threading.Thread(target=cb.chamar, args=(lambda timeout: liberar.wait(1),))
+    sondagem.start()
+    time.sleep(0.05)
+    with pytest.raises(CircuitoAberto):
+        cb.chamar(lambda timeout: 42)
+    liberar.set()
+    sondagem.join()
+    assert cb.estado == CircuitBreaker.FECHADO
+
+
+def test_chamada_lenta_esgota_o_prazo_no_teto():
+    cb, _ = breaker(injetor=InjetorFalhas(latencia_s=1.0))
+    inicio = time.monotonic()
+    with pytest.raises(PrazoEsgotado):
+        cb.chamar(lambda timeout: 42, teto_s=0.2)
+    assert time.monotonic() - inicio < 0.5
+
+
+def test_prazo_da_requisicao_limita_o_teto():
+    relogio = Relogio()
+    prazo = Prazo(1.0, relogio=relogio)
+    assert prazo.fatia(5) == 1.0
+    relogio.t = 0.75
+    assert prazo.fatia(5) == 0.25
+    relogio.t = 1.0
+    with pytest.raises(PrazoEsgotado):
+        prazo.fatia(5)
+
+
+def test_prazo_esgotado_nao_conta_como_falha():
+    cb, _ = breaker(limite_falhas=1)
+    prazo = Prazo(0.0)
+    with pytest.raises(PrazoEsgotado):
+        cb.chamar(lambda timeout: 42, prazo=prazo)
+    assert cb.estado == CircuitBreaker.FECHADO
+
+
+def test_erro_do_chamador_nao_abre_o_circuito():
+    cb, _ = breaker(limite_falhas=1)
+
+    def constraint(timeout):
+        raise ErroApi("23505")
+
+    for _ in range(3):
+        with pytest.raises(ErroApi):
+            cb.chamar(constraint)
+    assert cb.estado == CircuitBreaker.FECHADO
+
+
+def test_classificacao_de_falhas():
+    assert falha_de_dependencia(TimeoutError())
+    assert falha_de_dependencia(ConnectionError())
+    assert falha_de_dependencia(ErroApi("PGRST001"))
+    assert falha_de_dependencia(ErroApi("57014"))
+    assert not falha_de_dependencia(ErroApi("23505"))
+    assert not falha_de_dependencia(ErroApi("PGRST116"))
+    assert not falha_de_dependencia(ValueError())
+
+
+def test_sem_vagas_falha_rapido_sem_abrir_o_circuito():
+    cb, _ = breaker(limite_falhas=1, max_chamadas=1)
+    liberar = threading.Event()
+    ocupada = threading.Thread(target=cb.chamar, args=(lambda timeout: liberar.wait(1),))
+    ocupada.start()
+    time.sleep(0.05)
+    with pytest.raises(DependenciaSaturada):
+        cb.chamar(lambda timeout: 42)
+    liberar.set()
+    ocupada.join()
+    assert cb.estado == CircuitBreaker.FECHADO
+    assert cb.chamar(lambda timeout: 42) == 42
+
+
+def test_escrita_roda_na_thread_do_chamador():
+    cb, _ = breaker()
+    assert cb.chamar(lambda timeout: threading.get_ident(), abandonar=False) == threading.get_ident()
+
+
+def test_injetor_de_env(monkeypatch):
+    monkeypatch.setenv("FALHAS_TESTE", "latencia=0,erro=1")
+    cb, _ = breaker(injetor=InjetorFalhas.de_env("FALHAS_TESTE"))
+    with pytest.raises(ConnectionError, match="falha injetada"):
+        cb.chamar(lambda timeout: 42)
+    monkeypatch.delenv("FALHAS_TESTE")
+    assert InjetorFalhas.de_env("FALHAS_TESTE") is None
@@ -0,0 +1,189 @@
+import json, logging, os
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+# O script cria o cliente no import: credenciais falsas, nada sai da máquina
+os.environ.setdefault("SUPABASE_URL", "http://teste.invalid")
+os.environ.setdefault("SUPABASE_KEY", "teste.teste.teste")
+
+import webhook_resposta as wr
+from lembretes_incremental import shard_do_usuario
+
+AMANHA = (datetime.now(timezone.utc).date() + timedelta(days=1)).isoformat()
+DEPOIS = (datetime.now(timezone.utc).date() + timedelta(days=2)).isoformat()
+
+
+def agendamento(cod_id, user_id, date=AMANHA, horas="10:00:00", **extra):
+    linha = {
+        "cod_id": cod_id, "user_id": user_id, "date": date, "horas": horas,
+        "name_user": "Ana", "nome_atendente": "Dr. X", "company_name": "Clínica",
+        "status": "Agendado", "sms_3dias": False, "chat_ativo": False,
+        "updated_at": "2025-06-10T12:00:00+00:00",
+    }
+    linha.update(extra)
+    return linha
+
+
+class ConsultaFalsa:
+    def __init__(self, banco, tabela):
+        self.banco = banco
+        self.tabela = tabela
+        self.op = "select"
+        self.payload = None
+        self.filtros = []
+        self.colunas = set()
+
+    def select(self, *args):
+        return self
+
+    def insert(self, payload):
+        self.op, self.payload = "insert", payload
+        return self
+
+    def update(self, payload):
+        self.op, self.payload = "update", payload
+        return self
+
+    def eq(self, coluna, valor):
+        self.colunas.add(coluna)
+        self.filtros.append(lambda r: r.get(coluna) == valor)
+        return self
+
+    def gte(self, coluna, valor):
+        self.filtros.append(lambda r: r.get(coluna) >= valor)
+        return self
+
+    def lte(self, coluna, valor):
+        self.filtros.append(lambda r: r.get(coluna) <= valor)
+        return self
+
+    def or_(self, filtros):
+        return self
+
+    def execute(self):
+        return self.banco.executar(self)
+
+
+class SupabaseFalso:
+    """Stand-in em memória do PostgREST, com pontos para injetar concorrência e falhas"""
+
+    def __init__(self, agendamentos):
+        self.tabelas = {"agendamentos": agendamentos, "mensagens_chat": [], "mensagens_chat_historico": []}
+        self.apos_busca = None
+        self.falhar_insert = set()
+        self.falhar_reversao = False
+
+    def table(self, nome):
+        return ConsultaFalsa(self, nome)
+
+    def executar(self, consulta):
+        linhas = self.tabelas[consulta.tabela]
+        if consulta.op == "insert":
+            if consulta.payload.get("agendamento_id") in self.falhar_insert:
+                raise ConnectionError("insert falhou")
+            linhas.append(consulta.payload)
+            return SimpleNamespace(data=[consulta.payload])
+        alvo = [r for r in linhas if all(f(r) for f in consulta.filtros)]
+        if consulta.op == "update":
+            if self.falhar_reversao and consulta.payload.get("sms_3dias") is False:
+                raise ConnectionError("reversão falhou")
+            for r in alvo:
+                r.update(consulta.payload)
+            return SimpleNamespace(data=[dict(r) for r in alvo])
+        resultado = SimpleNamespace(data=[dict(r) for r in alvo])
+        # busca dos lembretes: outro worker pode agir entre ela e a reserva
+        if self.apos_busca and "sms_3dias" in consulta.colunas:
+            self.apos_busca(self)
+        return resultado
+
+    def enviados(self):
+        return sorted(m["agendamento_id"] for m in self.tabelas["mensagens_chat"])
+
+    def linha(self, cod_id):
+        return next(r for r in self.tabelas["agendamentos"] if r["cod_id"] == cod_id)
+
+
+@pytest.fixture
+def banco(monkeypatch):
+    def montar(agendamentos):
+        falso = SupabaseFalso(agendamentos)
+        monkeypatch.setattr(wr, "supabase", falso)
+        monkeypatch.setattr(wr, "COLUNA_ATUALIZACAO", "updated_at")
+        return falso
+    return montar
+
+
+def reexaminar(tmp_path, shard=(0, 1)):
+    caminho = wr.caminho_checkpoint(str(tmp_path / "ck.json"), shard)
+    with open(caminho) as f:
+        return json.load(f)["pendentes"]
+
+
+def test_envia_so_o_proximo_e_guarda_o_resto_para_reexaminar(banco, tmp_path):
+    falso = banco([
+        agendamento(1, "u1", date=DEPOIS),
+        agendamento(2, "u1", date=AMANHA),
+        agendamento(3, "u2"),
+        agendamento(4, "u3"),
+        # u3 já tem chat ativo: nada é enviado para ele agora
+        agendamento(5, "u3", date=AMANHA, sms_3dias=True, chat_ativo=True),
+    ])
+    wr.envia_lembretes(incremental=True, checkpoint=str(tmp_path / "ck.json"))
+
+    assert falso.enviados() == [2, 3]
+    assert falso.linha(2)["sms_3dias"] and falso.linha(2)["chat_ativo"]
+    assert reexaminar(tmp_path) == [1, 4]
+
+
+def test_reserva_perdida_para_outro_worker_nao_envia(banco, tmp_path):
+    falso = banco([agendamento(1, "u1"), agendamento(2, "u2")])
+
+    def outro_worker(db):
+        db.linha(1).update(sms_3dias=True, chat_ativo=True)
+    falso.apos_busca = outro_worker
+
+    wr.envia_lembretes(incremental=True, checkpoint=str(tmp_path / "ck.json"))
+
+    assert falso.enviados() == [2]
+    assert reexaminar(tmp_path) == []
+
+
+def test_insert_que_falha_reverte_a_reserva(banco, tmp_path):
+    falso = banco([agendamento(1, "u1"), agendamento(2, "u2")])
+    falso.falhar_insert = {1}
+
+    wr.envia_lembretes(incremental=True, checkpoint=str(tmp_path / "ck.json"))
+
+    assert falso.enviados() == [2]
+    assert not falso.linha(1)["sms_3dias"] and not falso.linha(1)["chat_ativo"]
+    assert reexaminar(tmp_path) == [1]
+
+
+def test_reversao_que_falha_registra_o_cod_id(banco, caplog):
+    falso = banco([agendamento(42, "u1")])
+    falso.falhar_insert = {42}
+    falso.falhar_reversao = True
+
+    with caplog.at_level(logging.ERROR):
+        wr.envia_lembretes()
+
+    assert any("42" in r.getMessage() and "corrigir manualmente" in r.getMessage() for r in caplog.records)
+
+
+def test_shards_dividem_os_usuarios_sem_envio_duplo(banco):
+    usuarios = [f"user-{i}" for i in range(12)]
+    falso = banco([agendamento(i, u) for i, u in enumerate(usuarios, start=1)])
+
+    por_shard = []
+    for i in range(3):
+        antes = set(falso.enviados())
+        wr.envia_lembretes(shard=(i, 3))
+        novos = set(falso.enviados()) - antes
+        por_shard.append(novos)
+        donos = {falso.linha(cod)["user_id"] for cod in novos}
+        assert all(shard_do_usuario(u, 3) == i for u in donos)
+
+    assert falso.enviados() == list(range(1, 13))
+    assert sum(len(s) for s in por_shard) == 12
@@ -1,7 +1,11 @@
 from supabase import create_client, Client as SupabaseClient
 from datetime import datetime, timedelta, timezone, time
 from dateutil.tz import tzlocal
-import os, logging
+import os, logging, argparse
+from lembretes_incremental import (
+    parse_shard, shard_do_usuario, caminho_checkpoint, carrega_checkpoint, salva_checkpoint,
+    filtros_incrementais, nova_marca
+)
 
 # CONFIG
 SUPABASE_URL = os.getenv("SUPABASE_URL")
@@ -9,6 +13,12 @@ SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 supabase: SupabaseClient = create_client(SUPABASE_URL, SUPABASE_KEY)
 logging.basicConfig(level=logging.INFO)
 
+# Modo incremental: arquivo local com a marca d'água da última execução
+CHECKPOINT_PADRAO = os.getenv("LEMBRETES_CHECKPOINT", "lembretes_checkpoint.json")
+# Coluna de "última alteração" (ex.: updated_at); obrigatória no modo incremental,
+# senão agendamentos remarcados/reativados no lugar nunca seriam vistos
+COLUNA_ATUALIZACAO = os.getenv("LEMBRETES_COLUNA_ATUALIZACAO")
+
 def formata_mensagem(nome, atd, empresa, data, hora):
     texto = (
         f"Bonjour {nome}, votre rendez-vous avec {atd} - {empresa} "
@@ -17,9 +27,18 @@ def formata_mensagem(nome, atd, empresa, data, hora):
     )
     return texto.replace("\n", " ").strip()[:800]
 
-def envia_lembretes():
+def envia_lembretes(incremental=False, checkpoint=CHECKPOINT_PADRAO, shard=(0, 1)):
     hoje = datetime.now(timezone.utc).date()
     fim = hoje + timedelta(days=3)
+    shard_i, shard_n = shard
+    caminho = caminho_checkpoint(checkpoint, shard)
+    if incremental and not COLUNA_ATUALIZACAO:
+        logging.warning(
+            "⚠️ --incremental sem LEMBRETES_COLUNA_ATUALIZACAO não enxerga agendamentos alterados; "
+            "fazendo varredura completa"
+        )
+        incremental = False
+    marca = carrega_checkpoint(caminho) if incremental else None
 
     # 1) Lista de usuários com chat ativo pendente
     pendentes = supabase.table("agendamentos") \
@@ -30,18 +49,34 @@ def envia_lembretes():
     usuarios_com_chat = {r["user_id"] for r in (pendentes.data or [])}
 
     # 2) Busca agendamentos de 3 dias ainda não enviados
-    resp = supabase.table("agendamentos") \
-        .select("cod_id, name_user, user_id, date, horas, nome_atendente, company_name") \
+    colunas = "cod_id, name_user, user_id, date, horas, nome_atendente, company_name"
+    if COLUNA_ATUALIZACAO:
+        colunas += f", {COLUNA_ATUALIZACAO}"
+    consulta = supabase.table("agendamentos") \
+        .select(colunas) \
         .eq("sms_3dias", False) \
         .eq("status", "Agendado") \
         .gte("date", hoje.isoformat()) \
-        .lte("date", fim.isoformat()) \
-        .execute()
+        .lte("date", fim.isoformat())
+
+    # Incremental: só o que é novo, o que entrou na janela desde a última execução,
+    # o que foi alterado, e o que ficou pendente da última vez
+    if marca:
+        consulta = consulta.or_(filtros_incrementais(marca, COLUNA_ATUALIZACAO))
+        logging.info(f"🔖 Modo incremental a partir de cod_id {marca['max_cod_id']} / janela até {marca['fim']}")
+    resp = consulta.execute()
+    linhas = resp.data or []
 
     # 3) Agrupa por user_id
     by_user: dict[str, list[dict]] = {}
-    for ag in resp.data or []:
+    # tudo do shard que não for enviado agora volta a ser examinado na próxima execução
+    a_reexaminar: set[int] = set()
+    for ag in linhas:
         uid = ag["user_id"]
+        # cada worker só trata os usuários do seu shard
+        if shard_do_usuario(uid, shard_n) != shard_i:
+            continue
+        a_reexaminar.add(ag["cod_id"])
         # só guarda quem NÃO está com chat ativo pendente
         if uid in usuarios_com_chat:
             continue
@@ -69,22 +104,40 @@ def envia_lembretes():
             # Monta e insere mensagem
             msg = formata_mensagem(nome, atd, empresa, data_str, hora)
 
-            # 2) Insere no chat
-            supabase.table("mensagens_chat").insert({
-                "user_id": user_id,
-                "mensagem": msg,
-                "tipo": "IA",
-                "agendamento_id": cod_id,
-                "data_envio": datetime.now(tzlocal()).isoformat()
-            }).execute()
-
-            # 3) Marca o agendamento imediatamente
-            supabase.table("agendamentos").update({
+            # 1) Reserva e marca o agendamento de uma vez: só um worker consegue virar sms_3dias
+            reserva = supabase.table("agendamentos").update({
                 "sms_3dias": True,
                 "chat_ativo": True
-            }).eq("cod_id", cod_id).execute()
+            }).eq("cod_id", cod_id).eq("sms_3dias", False).execute()
+            if not reserva.data:
+                logging.info(f"⏭️ Agendamento {cod_id} já reservado por outro worker")
+                a_reexaminar.discard(cod_id)
+                continue
 
-            # 4) Insere no histórico, mas sem quebrar se falhar
+            # 2) Insere no chat (libera a reserva se falhar)
+            try:
+                supabase.table("mensagens_chat").insert({
+                    "user_id": user_id,
+                    "mensagem": msg,
+                    "tipo": "IA",
+                    "agendamento_id": cod_id,
+                    "data_envio": datetime.now(tzlocal()).isoformat()
+                }).execute()
+            except Exception:
+                try:
+                    supabase.table("agendamentos").update({
+                        "sms_3dias": False,
+                        "chat_ativo": False
+                    }).eq("cod_id", cod_id).execute()
+                except Exception as rev_err:
+                    logging.error(
+                        f"❌ Agendamento {cod_id} ficou com sms_3dias=True sem lembrete enviado; "
+                        f"corrigir manualmente: {rev_err}"
+                    )
+                raise
+            a_reexaminar.discard(cod_id)
+
+            # 3) Insere no histórico, mas sem quebrar se falhar
             try:
                 supabase.table("mensagens_chat_historico").insert({
                     "user_id": user_id,
@@ -96,12 +149,29 @@ def envia_lembretes():
             except Exception as hist_err:
                 logging.warning(f"⚠️ Falha ao inserir histórico para ag. {cod_id}: {hist_err}")
                 
-            # 5) Confirma que tudo deu certo
+            # 4) Confirma que tudo deu certo
             logging.info(f"✅ Lembrete (ag. {cod_id}) enviado para user {user_id}")
         
         except Exception as e:
             logging.error(f"❌ Erro no agendamento {cod_id} user {user_id}: {e}")
 
+    # 5) Avança a marca d'água só depois de processar a leva
+    if incremental:
+        marca = nova_marca(marca, linhas, fim, a_reexaminar, COLUNA_ATUALIZACAO)
+        salva_checkpoint(caminho, marca)
+        logging.info(f"🔖 Checkpoint salvo em {caminho}: cod_id {marca['max_cod_id']}, {len(a_reexaminar)} pendente(s)")
+
 if __name__ == "__main__":
-    envia_lembretes()
+    parser = argparse.ArgumentParser(description="Envia lembretes de 3 dias")
+    parser.add_argument("--incremental", action="store_true",
+                        help="considera só agendamentos novos/alterados desde o último checkpoint "
+                             "(requer LEMBRETES_COLUNA_ATUALIZACAO)")
+    parser.add_argument("--checkpoint", default=CHECKPOINT_PADRAO,
+                        help="arquivo local da marca d'água (modo incremental)")
+    parser.add_argument("--shard", type=parse_shard, default=(0, 1),
+                        help="i/N: envia só para os user_id com crc32(user_id) %% N == i. "
+                             "Cada shard ainda busca a janela inteira e filtra localmente: "
+                             "divide os envios, não a carga da consulta")
+    args = parser.parse_args()
+    envia_lembretes(incremental=args.incremental, checkpoint=args.checkpoint, shard=args.shard)
 